@@ -1,48 +1,48 @@
 #!/usr/bin/env python3
 
-from flask import Flask, jsonify, request, send_file
-import requests
+from flask import Blueprint, Flask, Response, current_app, jsonify, request, send_file, stream_with_context
+from werkzeug.local import LocalProxy
 from fetch_data import FetchData
+from data_sources import DataSourceError
+from upstream_client import UpstreamError
+from rate_limit import RateLimiter, rate_limited
+from config import Config
+from query_profiler import QueryProfiler
+import atexit
 import os
 
-app = Flask(__name__)
+countries_bp = Blueprint('countries', __name__)
 
-fetcher = FetchData()
+# The FetchData of the app handling the current request, see create_app
+fetcher = LocalProxy(lambda: current_app.extensions['fetcher'])
 
-@app.route('/countries/refresh', methods=['POST'], strict_slashes=False)
+@countries_bp.route('/countries/refresh', methods=['POST'], strict_slashes=False)
+@rate_limited('refresh')
 def fetch_and_cache_countries():
     try:
-        fetcher.fetch_and_store_countries()
-        return jsonify({"message": "Countries data fetched and stored successfully."}), 200
+        stale_sources = fetcher.fetch_and_store_countries()
+        response = {"message": "Countries data fetched and stored successfully."}
+        if stale_sources:
+            response["stale_sources"] = stale_sources
+        return jsonify(response), 200
 
-    except requests.RequestException as e:
-        return jsonify({ "error": f"External data source unavailable", "details": f"Could not fetch data from {e.request.url}"}), 503
+    except UpstreamError as e:
+        return jsonify({ "error": "External data source unavailable", "details": f"Could not fetch data from {e.url}"}), 503
+
+    except DataSourceError as e:
+        return jsonify({ "error": "External data source unavailable", "details": str(e)}), 503
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/countries', methods=['GET'], strict_slashes=False)
+@countries_bp.route('/countries', methods=['GET'], strict_slashes=False)
+@rate_limited('list')
 def get_countries():
     region = request.args.get('region')
     currency = request.args.get('currency')
     sort = request.args.get('sort')
     try:
-        countries = fetcher.get_all_countries()
-        countries_list = [
-            {
-                "id": country.id,
-                "name": country.name,
-                "capital": country.capital,
-                "region": country.region,
-                "population": country.population,
-                "currency_code": country.currency_code,
-                "exchange_rate": country.exchange_rate,
-                "estimated_gdp": country.estimated_gdp,
-                "flag_url": country.flag_url,
-                "last_refreshed_at": country.last_refreshed_at.isoformat()
-            }
-            for country in countries
-        ]
+        countries_list = fetcher.get_snapshot().countries
 
         if region:
             countries_list = [country for country in countries_list if country['region'] == region]
@@ -63,7 +63,28 @@ def get_countries():
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/countries/<string:name>', methods=['GET'], strict_slashes=False)
+@countries_bp.route('/countries/export', methods=['GET'], strict_slashes=False)
+@rate_limited('list')
+def export_countries():
+    export_format = request.args.get('format', 'csv')
+    fields = request.args.get('fields')
+    columns = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    try:
+        stream = fetcher.export_countries(export_format, columns)
+    except ValueError as e:
+        return jsonify({"error": "Validation failed", "details": str(e)}), 400
+    except ImportError:
+        return jsonify({"error": f"Export format '{export_format}' requires pyarrow to be installed"}), 501
+    except Exception as e:
+        return jsonify({"error": "Internal server error"}), 500
+
+    return Response(
+        stream_with_context(stream),
+        mimetype=fetcher.exporter.mimetype(export_format),
+        headers={'Content-Disposition': f'attachment; filename="countries.{export_format}"'}
+    )
+
+@countries_bp.route('/countries/<string:name>', methods=['GET'], strict_slashes=False)
 def get_country_by_name(name):
     try:
         country = fetcher.get_country_by_name(name)
@@ -110,12 +131,10 @@ def get_country_by_name(name):
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/countries/<string:name>', methods=['DELETE'], strict_slashes=False)
+@countries_bp.route('/countries/<string:name>', methods=['DELETE'], strict_slashes=False)
 def delete_country_by_name(name):
     try:
-        country = fetcher.get_country_by_name(name)
-        if country:
-            fetcher.delete_country_by_name(name)
+        if fetcher.delete_country_by_name(name):
             return jsonify({"message": "Country deleted successfully."}), 200
         else:
             return jsonify({"message": "Country not found."}), 404
@@ -123,20 +142,14 @@ def delete_country_by_name(name):
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/status', methods=['GET'], strict_slashes=False)
+@countries_bp.route('/status', methods=['GET'], strict_slashes=False)
 def total_countries_and_last_refreshed():
     try:
-        countries = fetcher.get_all_countries()
-        total_countries = len(countries)
-
-        if countries:
-            last_refreshed_at = max(country.last_refreshed_at for country in countries) if countries else None
-        else:
-            last_refreshed_at = None
+        snapshot = fetcher.get_snapshot()
 
         return jsonify({
-            "total_countries": total_countries,
-            "last_refreshed_at": last_refreshed_at.isoformat() if last_refreshed_at else None
+            "total_countries": len(snapshot.countries),
+            "last_refreshed_at": snapshot.last_refreshed_at
         }), 200
 
     except Exception as e:
@@ -156,7 +169,8 @@ def total_countries_and_last_refreshed():
 #     except Exception as e:
 #         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/countries/image', methods=['GET'], strict_slashes=False)
+@countries_bp.route('/countries/image', methods=['GET'], strict_slashes=False)
+@rate_limited('image')
 def get_country_flags():
     try:
         image_path = 'cache/summary.png'
@@ -167,5 +181,53 @@ def get_country_flags():
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
 
+def create_app(fetcher=None):
+    '''
+    Build the Flask app
+    :param fetcher: FetchData to serve from, a default one is created when omitted
+    :return: Flask app
+    '''
+    app = Flask(__name__)
+
+    fetcher = fetcher or FetchData()
+    # Serve the first reads from the snapshot the last refresh left on disk instead of a DB scan
+    if fetcher.load_snapshot():
+        print(f"Warm started from snapshot with {len(fetcher.snapshot.countries)} countries")
+
+    app.extensions['fetcher'] = fetcher
+    limits = {
+        'refresh': (Config.REFRESH_RATE_PER_MINUTE, Config.REFRESH_RATE_BURST),
+        'list': (Config.LIST_RATE_PER_MINUTE, Config.LIST_RATE_BURST),
+        'image': (Config.IMAGE_RATE_PER_MINUTE, Config.IMAGE_RATE_BURST),
+    }
+    app.extensions['rate_limiters'] = {
+        name: RateLimiter(per_minute, burst)
+        for name, (per_minute, burst) in limits.items()
+        if per_minute > 0
+    }
+    app.register_blueprint(countries_bp)
+
+    if Config.QUERY_PROFILING:
+        register_query_profiler(app, QueryProfiler(fetcher.engine, explain=Config.QUERY_PROFILING_EXPLAIN))
+    return app
+
+def register_query_profiler(app, profiler):
+    ''' Profile the queries of every request and serve the per-endpoint report at GET /debug/queries '''
+    @app.before_request
+    def start_query_profile():
+        endpoint = request.url_rule.rule if request.url_rule else request.path
+        profiler.start_request(f"{request.method} {endpoint}")
+
+    @app.teardown_request
+    def end_query_profile(exception=None):
+        profiler.end_request()
+
+    @app.route('/debug/queries', methods=['GET'], strict_slashes=False)
+    def query_report():
+        return jsonify(profiler.report()), 200
+
+    app.extensions['query_profiler'] = profiler
+    atexit.register(profiler.print_report)
+
 if __name__ == '__main__':
-    app.run(port=3000, host="0.0.0.0", debug=True)
+    create_app().run(port=3000, host="0.0.0.0", debug=True)
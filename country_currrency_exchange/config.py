@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+
+class Config:
+    # Number of rows fetched per round trip when streaming exports
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+    # Upstream data: http (live APIs), file (DATA_SOURCE_PATH), replay (RECORDINGS_DIR) or stub
+    DATA_SOURCE = os.getenv('DATA_SOURCE', 'http')
+    DATA_SOURCE_PATH = os.getenv('DATA_SOURCE_PATH', 'fixtures')
+    COUNTRIES_API_URL = os.getenv('COUNTRIES_API_URL', 'https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies')
+    EXCHANGE_RATE_API_URL = os.getenv('EXCHANGE_RATE_API_URL', 'https://open.er-api.com/v6/latest/USD')
+    UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', 10))
+
+    # Upstream resilience: retries with jittered backoff, per-source circuit breakers
+    # (opened after BREAKER_FAILURE_THRESHOLD fetches in a row fail all their retries),
+    # and a hedged duplicate request when restcountries is slower than COUNTRIES_HEDGE_AFTER seconds (0 disables)
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 2))
+    UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.5))
+    UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', 5))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 3))
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 60))
+    COUNTRIES_HEDGE_AFTER = float(os.getenv('COUNTRIES_HEDGE_AFTER', 3))
+    # Total seconds one source may take, retries and backoff included, before falling back
+    UPSTREAM_DEADLINE = float(os.getenv('UPSTREAM_DEADLINE', 15))
+
+    # Refresh pipeline: bounded queue size between stages, worker threads per stage and rows per write transaction
+    REFRESH_QUEUE_SIZE = int(os.getenv('REFRESH_QUEUE_SIZE', 256))
+    REFRESH_PARSE_WORKERS = int(os.getenv('REFRESH_PARSE_WORKERS', 2))
+    REFRESH_TRANSFORM_WORKERS = int(os.getenv('REFRESH_TRANSFORM_WORKERS', 2))
+    REFRESH_BATCH_SIZE = int(os.getenv('REFRESH_BATCH_SIZE', 100))
+
+    # Last good upstream payloads, replayed when upstream fails
+    RECORD_RESPONSES = os.getenv('RECORD_RESPONSES', '1') == '1'
+    RECORDINGS_DIR = os.getenv('RECORDINGS_DIR', os.path.join('cache', 'recordings'))
+
+    # Serialized read snapshot, rewritten after each refresh and used to warm new workers
+    SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join('cache', 'snapshot.json'))
+
+    # Per-client token bucket limits: requests per minute and burst size (0 per minute disables)
+    REFRESH_RATE_PER_MINUTE = int(os.getenv('REFRESH_RATE_PER_MINUTE', 2))
+    REFRESH_RATE_BURST = int(os.getenv('REFRESH_RATE_BURST', 2))
+    LIST_RATE_PER_MINUTE = int(os.getenv('LIST_RATE_PER_MINUTE', 120))
+    LIST_RATE_BURST = int(os.getenv('LIST_RATE_BURST', 30))
+    IMAGE_RATE_PER_MINUTE = int(os.getenv('IMAGE_RATE_PER_MINUTE', 30))
+    IMAGE_RATE_BURST = int(os.getenv('IMAGE_RATE_BURST', 10))
+
+    # Debug: log every SQL statement with timing and EXPLAIN output, flag repeated queries per request
+    # and serve a per-endpoint summary at GET /debug/queries
+    QUERY_PROFILING = os.getenv('QUERY_PROFILING', '0') == '1'
+    QUERY_PROFILING_EXPLAIN = os.getenv('QUERY_PROFILING_EXPLAIN', '1') == '1'
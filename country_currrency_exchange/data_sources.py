@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import copy
+import json
+import os
+from config import Config
+from upstream_client import UpstreamClient, UpstreamError
+
+COUNTRIES_FILE = 'countries.json'
+EXCHANGE_RATES_FILE = 'exchange_rates.json'
+
+class DataSourceError(Exception):
+    """Raised when a non-HTTP data source cannot provide a payload"""
+
+class StalePayload(Exception):
+    """
+    Raised instead of returning when a source could only serve an old payload,
+    so callers can report the data as stale
+    :param payload: The old payload, usable as a fallback
+    """
+    def __init__(self, message, payload):
+        super().__init__(message)
+        self.payload = payload
+
+class HttpDataSource:
+    """Fetch payloads from the live upstream APIs through a resilient UpstreamClient"""
+    def __init__(self, countries_url, exchange_rates_url, client=None, countries_hedge_after=None):
+        self.countries_url = countries_url.strip()
+        self.exchange_rates_url = exchange_rates_url.strip()
+        self.client = client or UpstreamClient()
+        self.countries_hedge_after = countries_hedge_after
+
+    def fetch_countries(self):
+        return self.client.get_json('countries', self.countries_url, hedge_after=self.countries_hedge_after)
+
+    def fetch_exchange_rates(self):
+        return self.client.get_json('exchange_rates', self.exchange_rates_url)
+
+class FileDataSource:
+    """
+    Read payloads from disk
+    :param path: Either a directory holding countries.json and exchange_rates.json,
+                 or a single JSON file of the form {"countries": [...], "exchange_rates": {...}}.
+                 Exchange rates may be the full upstream response ({"rates": {...}, ...})
+                 or just the rates map ({"NGN": 1600, ...}).
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self, file_name, key):
+        if os.path.isdir(self.path):
+            file_path = os.path.join(self.path, file_name)
+        else:
+            file_path = self.path
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as payload_file:
+                payload = json.load(payload_file)
+        except (OSError, ValueError) as e:
+            raise DataSourceError(f"Could not read {file_path}: {e}")
+
+        if not os.path.isdir(self.path):
+            if key not in payload:
+                raise DataSourceError(f"{file_path} has no '{key}' entry")
+            payload = payload[key]
+        return payload
+
+    def fetch_countries(self):
+        return self._load(COUNTRIES_FILE, 'countries')
+
+    def fetch_exchange_rates(self):
+        payload = self._load(EXCHANGE_RATES_FILE, 'exchange_rates')
+        if isinstance(payload, dict) and isinstance(payload.get('rates'), dict) and payload['rates']:
+            return payload
+        if isinstance(payload, dict) and payload and all(isinstance(rate, (int, float)) for rate in payload.values()):
+            return {'rates': payload}
+        raise DataSourceError(f"No exchange rates found in {self.path}")
+
+class StubDataSource:
+    """Serve in-process payloads, for tests and benchmarks"""
+    def __init__(self, countries=None, exchange_rates=None):
+        self.countries = countries if countries is not None else []
+        self.exchange_rates = exchange_rates if exchange_rates is not None else {'rates': {}}
+
+    def fetch_countries(self):
+        return copy.deepcopy(self.countries)
+
+    def fetch_exchange_rates(self):
+        return copy.deepcopy(self.exchange_rates)
+
+class RecordingDataSource:
+    """
+    Wrap another data source, keeping the last good payload of each kind on disk.
+    When the wrapped source fails the recorded payload is raised as a StalePayload, and
+    the recordings directory can be replayed later with a FileDataSource.
+    """
+    def __init__(self, source, directory):
+        self.source = source
+        self.directory = directory
+
+    def _record(self, file_name, payload):
+        os.makedirs(self.directory, exist_ok=True)
+        file_path = os.path.join(self.directory, file_name)
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as payload_file:
+            json.dump(payload, payload_file)
+        # Replace atomically so a reader never sees a half written recording
+        os.replace(temp_path, file_path)
+
+    def _fetch(self, method_name, file_name):
+        try:
+            payload = getattr(self.source, method_name)()
+        except (UpstreamError, DataSourceError) as e:
+            file_path = os.path.join(self.directory, file_name)
+            if not os.path.exists(file_path):
+                raise
+            # Replay the recording the same way DATA_SOURCE=replay would
+            payload = getattr(FileDataSource(self.directory), method_name)()
+            raise StalePayload(f"{e}, served recorded {file_path}", payload) from e
+
+        try:
+            self._record(file_name, payload)
+        except OSError as e:
+            print(f"Failed to record {file_name}: {e}")
+        return payload
+
+    def fetch_countries(self):
+        return self._fetch('fetch_countries', COUNTRIES_FILE)
+
+    def fetch_exchange_rates(self):
+        return self._fetch('fetch_exchange_rates', EXCHANGE_RATES_FILE)
+
+def create_data_source(config=Config):
+    """Build the data source selected by config.DATA_SOURCE (http, file, replay or stub)"""
+    kind = config.DATA_SOURCE
+
+    if kind == 'http':
+        client = UpstreamClient(
+            timeout=config.UPSTREAM_TIMEOUT,
+            max_retries=config.UPSTREAM_MAX_RETRIES,
+            backoff_base=config.UPSTREAM_BACKOFF_BASE,
+            backoff_max=config.UPSTREAM_BACKOFF_MAX,
+            failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=config.BREAKER_RESET_TIMEOUT,
+            deadline=config.UPSTREAM_DEADLINE
+        )
+        source = HttpDataSource(
+            config.COUNTRIES_API_URL,
+            config.EXCHANGE_RATE_API_URL,
+            client=client,
+            countries_hedge_after=config.COUNTRIES_HEDGE_AFTER
+        )
+        if config.RECORD_RESPONSES:
+            source = RecordingDataSource(source, config.RECORDINGS_DIR)
+        return source
+    if kind == 'file':
+        return FileDataSource(config.DATA_SOURCE_PATH)
+    if kind == 'replay':
+        return FileDataSource(config.RECORDINGS_DIR)
+    if kind == 'stub':
+        return StubDataSource()
+
+    raise ValueError(f"Unknown DATA_SOURCE '{kind}', expected one of: http, file, replay, stub")
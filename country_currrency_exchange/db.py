@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
 from country import Base, Country
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
@@ -9,13 +9,13 @@ class DB:
     def __init__(self):
         self.engine = create_engine('sqlite:///countries.db')
         Base.metadata.create_all(self.engine)
+        self._sessionmaker = sessionmaker(bind=self.engine)
         self.__session = None
 
     @property
     def _session(self):
         if self.__session is None:
-            DBSession = sessionmaker(bind=self.engine)
-            self.__session = DBSession()
+            self.__session = self._sessionmaker()
         return self.__session
 
     def add_country(self, name, capital, region, population, currency_code, exchange_rate, estimated_gdp, flag_url, last_refreshed_at):
@@ -50,9 +50,59 @@ class DB:
 
             return new_country
 
+    def upsert_countries(self, countries):
+        '''
+        Insert or update a batch of countries in one transaction
+        :param countries: List of dicts keyed by Country column name
+        '''
+        session = self._sessionmaker()
+        try:
+            names = [country['name'] for country in countries]
+            existing = {
+                country.name: country
+                for country in session.query(Country).filter(Country.name.in_(names))
+            }
+            for values in countries:
+                country = existing.get(values['name'])
+                if country:
+                    for column, value in values.items():
+                        setattr(country, column, value)
+                else:
+                    existing[values['name']] = Country(**values)
+                    session.add(existing[values['name']])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def expire_all(self):
+        ''' Make the shared session reload rows written through other sessions '''
+        self._session.expire_all()
+
     def get_all_countries(self):
         return self._session.query(Country).all()
 
+    def iter_country_rows(self, columns, batch_size=1000):
+        """
+        Stream country rows from a server-side cursor
+        :param columns: Names of the Country columns to select
+        :param batch_size: Number of rows fetched per round trip
+        :return: Generator of row lists, at most batch_size rows each
+        """
+        table = Country.__table__
+        query = select(*[table.c[column] for column in columns]).order_by(table.c.id)
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for rows in result.partitions():
+                yield rows
+
+    def get_exchange_rates(self):
+        ''' Last stored exchange rate per currency code '''
+        query = select(Country.currency_code, Country.exchange_rate).where(Country.exchange_rate > 0).distinct()
+        return {currency_code: exchange_rate for currency_code, exchange_rate in self._session.execute(query)}
+
     def get_country_by_name(self, name):
         return self._session.query(Country).filter_by(name=name).first()
 
@@ -61,5 +111,6 @@ class DB:
         if country_to_delete:
             self._session.delete(country_to_delete)
             self._session.commit()
+            return True
 
-            return None
+        return False
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import csv
+import io
+import json
+from datetime import datetime
+from country import Country
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # pyarrow records absolute offsets in the parquet footer
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class CountryExporter:
+    FORMATS = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+        'parquet': 'application/vnd.apache.parquet',
+        'arrow': 'application/vnd.apache.arrow.stream',
+    }
+
+    def __init__(self, db, batch_size=1000):
+        self._db = db
+        self.batch_size = batch_size
+        self.columns = [column.name for column in Country.__table__.columns]
+
+    def mimetype(self, export_format):
+        return self.FORMATS[export_format]
+
+    def stream(self, export_format, columns=None):
+        """
+        Build a byte stream of all countries in the requested format
+        :param export_format: One of csv, ndjson, parquet or arrow
+        :param columns: Optional list of column names to project
+        :return: Generator of bytes chunks, one per DB batch
+        """
+        if export_format not in self.FORMATS:
+            raise ValueError(f"Unsupported format '{export_format}', expected one of: {', '.join(self.FORMATS)}")
+
+        columns = columns or self.columns
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+        if export_format in ('parquet', 'arrow'):
+            # Binary formats are optional; fail before any bytes are sent
+            import pyarrow  # noqa: F401
+
+        return getattr(self, f'_stream_{export_format}')(columns)
+
+    def _batches(self, columns):
+        return self._db.iter_country_rows(columns, batch_size=self.batch_size)
+
+    def _stream_csv(self, columns):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in self._batches(columns):
+            writer.writerows(
+                [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                for row in rows
+            )
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        remaining = buffer.getvalue()
+        if remaining:
+            yield remaining.encode('utf-8')
+
+    def _stream_ndjson(self, columns):
+        for rows in self._batches(columns):
+            lines = [json.dumps(dict(zip(columns, row)), default=lambda value: value.isoformat()) for row in rows]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _arrow_schema(self, columns):
+        import pyarrow as pa
+
+        arrow_types = {int: pa.int64(), float: pa.float64(), str: pa.string(), datetime: pa.timestamp('us')}
+        table = Country.__table__
+        return pa.schema([(column, arrow_types[table.c[column].type.python_type]) for column in columns])
+
+    def _record_batch(self, schema, rows):
+        import pyarrow as pa
+
+        values = list(zip(*rows))
+        arrays = [pa.array(values[index], type=field.type) for index, field in enumerate(schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def _stream_parquet(self, columns):
+        import pyarrow.parquet as pq
+
+        schema = self._arrow_schema(columns)
+        sink = _StreamSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            for rows in self._batches(columns):
+                # Each DB batch becomes its own row group
+                writer.write_batch(self._record_batch(schema, rows))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    def _stream_arrow(self, columns):
+        import pyarrow as pa
+
+        schema = self._arrow_schema(columns)
+        sink = _StreamSink()
+        writer = pa.ipc.new_stream(sink, schema)
+        try:
+            for rows in self._batches(columns):
+                writer.write_batch(self._record_batch(schema, rows))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
@@ -3,90 +3,283 @@
 from db import DB
 from country import Country
 from datetime import datetime, timezone
+import contextvars
+import os
 import random
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from image_generator import ImageGenerator
+from exporter import CountryExporter
+from config import Config
+from data_sources import DataSourceError, StalePayload, create_data_source
+from upstream_client import UpstreamError
+from refresh_pipeline import RefreshPipeline, Stage
+from snapshot import ReadSnapshot
+from single_flight import SingleFlight
+
+UPSTREAM_ERRORS = (DataSourceError, UpstreamError)
 
 class FetchData:
-    def __init__(self):
+    def __init__(self, data_source=None):
         self._db = DB()
+        self.data_source = data_source or create_data_source()
         self.image_generator = ImageGenerator()
+        self.exporter = CountryExporter(self._db, batch_size=Config.EXPORT_BATCH_SIZE)
+        self.snapshot = None
+        self.post_refresh_hooks = [self._render_summary_image, self._rebuild_snapshot]
+        self.last_refresh_stats = []
+        self._single_flight = SingleFlight()
 
-    def fetch_and_store_countries(self):
-        country_api_url = "https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies"
-        exchange_rate_api_url = " https://open.er-api.com/v6/latest/USD"
+    @property
+    def engine(self):
+        return self._db.engine
+
+    def _stored_countries_payload(self):
+        ''' Rebuild an upstream shaped countries payload from what is already stored '''
+        return [
+            {
+                "name": country.name,
+                "capital": country.capital,
+                "region": country.region,
+                "population": country.population,
+                "flag": country.flag_url,
+                "currencies": [{"code": country.currency_code}]
+            }
+            for country in self.get_all_countries()
+        ]
 
+    def _payload_result(self, future, source, stale_sources):
+        ''' Payload of a fetch, accepting a recorded fallback but reporting the source as stale '''
         try:
-            countries_response = requests.get(country_api_url, timeout=20)
-            countries_response.raise_for_status()
-            countries_data = countries_response.json()
+            return future.result()
+        except StalePayload as stale:
+            print(f"{source} source failed ({stale}), using the recorded payload")
+            stale_sources.append(source)
+            return stale.payload
 
-            exchange_rate_response = requests.get(exchange_rate_api_url, timeout=20)
-            exchange_rate_response.raise_for_status()
-            exchange_rate_data = exchange_rate_response.json()
-            exchange_rates = exchange_rate_data.get('rates', {})
+    def _fetch_payloads(self):
+        '''
+        Fetch both upstream payloads, falling back to stored data when one source fails
+        :return: Tuple of (countries_data, exchange_rates, stale_sources)
+        '''
+        stale_sources = []
 
-            for country_info in countries_data:
-                try:
-                    name = country_info.get('name')
-                    capital = country_info.get('capital', None)
-                    region = country_info.get('region', None)
-                    population = country_info.get('population', 0)
+        # Fetch both sources at once so the refresh waits on the slower one, not the sum
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            countries_future = executor.submit(self.data_source.fetch_countries)
+            rates_future = executor.submit(self.data_source.fetch_exchange_rates)
+
+        try:
+            countries_data = self._payload_result(countries_future, 'countries', stale_sources)
+        except UPSTREAM_ERRORS as countries_error:
+            countries_data = self._stored_countries_payload()
+            if not countries_data:
+                raise
+            print(f"Countries source failed ({countries_error}), using stored countries")
+            stale_sources.append('countries')
+
+        try:
+            exchange_rates = self._payload_result(rates_future, 'exchange_rates', stale_sources).get('rates', {})
+        except UPSTREAM_ERRORS as rates_error:
+            exchange_rates = self._db.get_exchange_rates()
+            if not exchange_rates or stale_sources:
+                # Nothing fresh left to recompute with, keep the stored data as it is
+                raise
+            print(f"Exchange rate source failed ({rates_error}), recomputing with stored rates")
+            stale_sources.append('exchange_rates')
+
+        return countries_data, exchange_rates, stale_sources
+
+    def _parse_country(self, item, emit):
+        country_info, exchange_rates = item
+        name = None
+        try:
+            name = country_info.get('name')
+            population = country_info.get('population', 0)
+
+            currencies = country_info.get('currencies', [])
+            currency_code = None
+            if currencies and isinstance(currencies, list) and len(currencies) > 0:
+                currency_code = currencies[0].get('code')
+
+            if not name or population is None or not currency_code:
+                return
 
-                    currencies = country_info.get('currencies', [])
-                    currency_code = None
-                    if currencies and isinstance(currencies, list) and len(currencies) > 0:
-                        currency_code = currencies[0].get('code')
+            country = {
+                "name": name,
+                "capital": country_info.get('capital', None),
+                "region": country_info.get('region', None),
+                "population": population,
+                "currency_code": currency_code,
+                "flag_url": country_info.get('flag')
+            }
 
+        except Exception as e:
+            print(f"Failed to parse country {name}: {e}")
+            return
 
-                    if not name or population is None or not currency_code:
-                        continue
+        emit((country, exchange_rates))
 
-                    exchange_rate = exchange_rates.get(currency_code) if currency_code else None
+    def _transform_country(self, item, emit):
+        country, exchange_rates = item
+        try:
+            exchange_rate = exchange_rates.get(country['currency_code'])
 
-                    if exchange_rate and exchange_rate != 0:
-                        estimated_gdp = population * random.randint(1000, 2000) / exchange_rate
-                    else:
-                        exchange_rate = 0.0
-                        estimated_gdp = 0
+            if exchange_rate and exchange_rate != 0:
+                estimated_gdp = country['population'] * random.randint(1000, 2000) / exchange_rate
+            else:
+                exchange_rate = 0.0
+                estimated_gdp = 0
 
-                    flag_url = country_info.get('flag')
-                    last_refreshed_at = datetime.now(timezone.utc)
+            country['exchange_rate'] = exchange_rate
+            country['estimated_gdp'] = estimated_gdp
+            country['last_refreshed_at'] = datetime.now(timezone.utc)
 
+        except Exception as e:
+            print(f"Failed to transform country {country['name']}: {e}")
+            return
 
-                    self._db.add_country(
-                        name=name,
-                        capital=capital,
-                        region=region,
-                        population=population,
-                        currency_code=currency_code,
-                        exchange_rate=exchange_rate,
-                        estimated_gdp=estimated_gdp,
-                        flag_url=flag_url,
-                        last_refreshed_at=last_refreshed_at
-                    )
+        emit(country)
 
+    def _write_countries(self, countries, emit):
+        try:
+            self._db.upsert_countries(countries)
+        except Exception as e:
+            print(f"Failed to store batch of {len(countries)} countries, retrying one by one: {e}")
+            # Only the bad rows should be lost, not the whole batch
+            for country in countries:
+                try:
+                    self._db.upsert_countries([country])
                 except Exception as e:
-                    print(f"Failed to insert country {name}: {e}")
+                    print(f"Failed to insert country {country['name']}: {e}")
+                    continue
+                emit(country['name'])
+            return
 
-            countries = self.get_all_countries()
-            self.image_generator.generate_summary_image(countries)
+        for country in countries:
+            emit(country['name'])
 
-        except requests.RequestException as e:
+    def _render_summary_image(self, countries):
+        self.image_generator.generate_summary_image(countries)
+
+    def _save_snapshot(self, snapshot):
+        try:
+            snapshot.save(Config.SNAPSHOT_PATH)
+        except OSError as e:
+            print(f"Failed to save snapshot to {Config.SNAPSHOT_PATH}: {e}")
+        self.snapshot = snapshot
+
+    def _rebuild_snapshot(self, countries):
+        self._save_snapshot(ReadSnapshot.from_countries(countries))
+
+    def load_snapshot(self):
+        ''' Warm the read snapshot from the one the last refresh left on disk '''
+        self.snapshot = ReadSnapshot.load(Config.SNAPSHOT_PATH)
+        return self.snapshot is not None
+
+    def get_snapshot(self):
+        '''
+        Current read snapshot, reloaded when another worker saved a newer one
+        and built from the DB when there is none on disk
+        '''
+        snapshot = self.snapshot
+        try:
+            mtime = os.path.getmtime(Config.SNAPSHOT_PATH)
+        except OSError:
+            mtime = None
+
+        if snapshot is not None and (mtime is None or snapshot.mtime is None or mtime == snapshot.mtime):
+            return snapshot
+
+        return self._single_flight.do('snapshot', lambda: self._reload_snapshot(mtime))
+
+    def _reload_snapshot(self, mtime):
+        snapshot = ReadSnapshot.load(Config.SNAPSHOT_PATH) if mtime is not None else None
+        if snapshot is None:
+            self._save_snapshot(ReadSnapshot.from_countries(self.get_all_countries()))
+        else:
+            self.snapshot = snapshot
+        return self.snapshot
+
+    def _run_post_refresh_hooks(self):
+        countries = self.get_all_countries()
+        # Each hook runs in a copy of the refresh's context, e.g. to keep the query profiler's current request
+        hook_threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(hook, countries),
+                name=f"refresh-hook-{index}",
+                daemon=True
+            )
+            for index, hook in enumerate(self.post_refresh_hooks)
+        ]
+        for thread in hook_threads:
+            thread.start()
+        for thread in hook_threads:
+            thread.join()
+
+    def fetch_and_store_countries(self):
+        '''
+        Refresh stored countries from the data source. Concurrent callers share one refresh.
+        :return: List of sources that failed and were served from stored data
+        '''
+        return self._single_flight.do('refresh', self._refresh)
+
+    def _refresh(self):
+        stale_sources = []
+
+        def fetch(_, emit):
+            countries_data, exchange_rates, stale = self._fetch_payloads()
+            stale_sources.extend(stale)
+            for country_info in countries_data:
+                emit((country_info, exchange_rates))
+
+        pipeline = RefreshPipeline([
+            Stage('fetch', fetch),
+            Stage('parse', self._parse_country, workers=Config.REFRESH_PARSE_WORKERS),
+            Stage('transform', self._transform_country, workers=Config.REFRESH_TRANSFORM_WORKERS),
+            Stage('write', self._write_countries, batch_size=Config.REFRESH_BATCH_SIZE),
+        ], queue_size=Config.REFRESH_QUEUE_SIZE)
+
+        try:
+            self.last_refresh_stats = pipeline.run()
+            for stats in self.last_refresh_stats:
+                print(
+                    f"Refresh stage {stats['stage']}: {stats['items_in']} in, {stats['items_out']} out, "
+                    f"busy {stats['busy_seconds']}s, starved {stats['starved_seconds']}s, "
+                    f"blocked by downstream {stats['blocked_seconds']}s"
+                )
+
+            # The writer used its own session, drop what the shared one still holds
+            self._db.expire_all()
+            self._run_post_refresh_hooks()
+
+        except UPSTREAM_ERRORS as e:
             print(f"Error fetching data from API: {e}")
             raise
 
         except Exception as e:
             print(f"Error fetching or storing countries data: {e}")
+            raise
+
+        return stale_sources
 
     def get_all_countries(self):
         return self._db.get_all_countries()
 
+    def export_countries(self, export_format, columns=None):
+        return self.exporter.stream(export_format, columns)
+
     def get_country_by_name(self, name):
         return self._db.get_country_by_name(name)
 
     def delete_country_by_name(self, name):
-        country_to_delete = self.get_country_by_name(name)
-        if country_to_delete:
-            self._db.delete_country_by_name(name)
-            return None
+        '''
+        Delete a country
+        :return: True if the country existed
+        '''
+        deleted = self._db.delete_country_by_name(name)
+        if deleted:
+            # get_snapshot picks up a snapshot another worker saved, so the row goes from that one too
+            self._save_snapshot(self.get_snapshot().without(name))
+        return deleted
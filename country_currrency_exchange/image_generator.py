@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-from PIL import Image, ImageDraw, ImageFont
 import os
 from datetime import datetime
 
@@ -8,10 +7,6 @@ class ImageGenerator:
     def __init__(self):
         self.cache_dir = 'cache'
         self.image_path = os.path.join(self.cache_dir, 'summary.png')
-        
-        # Create cache directory if it doesn't exist
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
 
     def generate_summary_image(self, countries):
         """
@@ -20,6 +15,12 @@ class ImageGenerator:
         :return: Boolean indicating success
         """
         try:
+            # PIL is only needed on refresh, keep it out of app startup
+            from PIL import Image, ImageDraw, ImageFont
+
+            # Create cache directory if it doesn't exist
+            os.makedirs(self.cache_dir, exist_ok=True)
+
             total_countries = len(countries)
             
             # Get top 5 countries by GDP
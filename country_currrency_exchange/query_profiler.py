@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import contextvars
+import threading
+import time
+from collections import Counter
+from sqlalchemy import event
+
+BACKGROUND = '<background>'
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+    'mariadb': 'EXPLAIN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+class _Request:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.queries = []
+        # Threads started by the request (refresh pipeline, post refresh hooks) append concurrently
+        self.lock = threading.Lock()
+
+class QueryProfiler:
+    """
+    Log every SQL statement run through an engine with its timing and query plan,
+    flag statements repeated within one request, and keep a per-endpoint summary.
+    The current request is held in a context variable, so threads that run in a copy
+    of the request's context count toward it. Other queries are counted under
+    <background>, which serves no requests.
+    """
+    def __init__(self, engine, explain=True):
+        self.engine = engine
+        self.explain = explain
+        self._explain_prefix = EXPLAIN_PREFIXES.get(engine.dialect.name)
+        self._plans = {}
+        self._request = contextvars.ContextVar('query_profiler_request', default=None)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def start_request(self, endpoint):
+        self._request.set(_Request(endpoint))
+
+    def end_request(self):
+        """Log the current request's query summary and add it to its endpoint's totals"""
+        current = self._request.get()
+        self._request.set(None)
+        if current is None:
+            return
+
+        with current.lock:
+            queries = list(current.queries)
+        repeated = self._repeated(queries)
+        total_ms = sum(query['ms'] for query in queries)
+        print(f"[queries] {current.endpoint}: {len(queries)} queries, {total_ms:.2f}ms, {sum(repeated.values())} redundant")
+        self._add_to_endpoint(current.endpoint, len(queries), total_ms, sum(repeated.values()))
+
+    def _repeated(self, queries):
+        ''' Extra executions of each identical (statement, parameters) pair '''
+        counts = Counter((query['statement'], query['parameters']) for query in queries if not query['executemany'])
+        return {key: count - 1 for key, count in counts.items() if count > 1}
+
+    def _add_to_endpoint(self, endpoint, query_count, total_ms, redundant, request=True):
+        with self._lock:
+            summary = self._endpoints.setdefault(endpoint, {
+                "endpoint": endpoint,
+                "requests": 0,
+                "queries": 0,
+                "total_ms": 0.0,
+                "redundant_queries": 0,
+                "max_queries_per_request": 0,
+            })
+            summary["queries"] += query_count
+            summary["total_ms"] += total_ms
+            summary["redundant_queries"] += redundant
+            if request:
+                summary["requests"] += 1
+                summary["max_queries_per_request"] = max(summary["max_queries_per_request"], query_count)
+
+    def report(self):
+        """
+        Per-endpoint summary, endpoints with the most redundant queries first
+        :return: List of dicts
+        """
+        with self._lock:
+            summaries = [dict(summary) for summary in self._endpoints.values()]
+
+        for summary in summaries:
+            summary["total_ms"] = round(summary["total_ms"], 2)
+            summary["avg_queries_per_request"] = round(summary["queries"] / summary["requests"], 2) if summary["requests"] else 0
+        return sorted(summaries, key=lambda summary: (summary["redundant_queries"], summary["total_ms"]), reverse=True)
+
+    def print_report(self):
+        for summary in self.report():
+            print(
+                f"[queries] {summary['endpoint']}: {summary['requests']} requests, {summary['queries']} queries "
+                f"(max {summary['max_queries_per_request']}/request), {summary['total_ms']}ms, "
+                f"{summary['redundant_queries']} redundant"
+            )
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_started_at'].pop()) * 1000
+        current = self._request.get()
+        endpoint = current.endpoint if current is not None else BACKGROUND
+
+        print(f"[query] {endpoint} {elapsed_ms:.2f}ms {statement} {parameters!r}")
+        plan = self._explain(conn, statement, parameters, executemany)
+        if plan:
+            print(f"[query plan] {plan}")
+
+        if current is None:
+            # Background queries add to the totals without counting as requests
+            self._add_to_endpoint(BACKGROUND, 1, elapsed_ms, 0, request=False)
+            return
+
+        # An executemany may run as several cursor executions that all report the whole batch's parameters
+        query = {"statement": statement, "parameters": repr(parameters), "ms": elapsed_ms, "executemany": executemany}
+        with current.lock:
+            current.queries.append(query)
+            seen = sum(
+                1 for previous in current.queries
+                if not previous["executemany"] and previous["statement"] == statement and previous["parameters"] == query["parameters"]
+            )
+        if seen > 1:
+            print(f"[query] WARNING {endpoint} ran the same query {seen} times in one request: {statement} {parameters!r}")
+
+    def _explain(self, conn, statement, parameters, executemany):
+        if not self.explain or executemany or not self._explain_prefix:
+            return None
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return None
+
+        # Plans depend on the statement, not its parameters, so explain each statement once
+        if statement not in self._plans:
+            try:
+                # A raw DBAPI cursor bypasses the engine events, so EXPLAIN is not profiled itself
+                explain_cursor = conn.connection.cursor()
+                try:
+                    explain_cursor.execute(self._explain_prefix + statement, parameters)
+                    self._plans[statement] = '; '.join(' '.join(str(value) for value in row) for row in explain_cursor.fetchall())
+                finally:
+                    explain_cursor.close()
+            except Exception as e:
+                self._plans[statement] = f"EXPLAIN failed: {e}"
+        return self._plans[statement]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import contextvars
+import queue
+import threading
+import time
+
+_DONE = object()
+
+class StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        # Time spent waiting on an empty input queue: this stage is faster than upstream
+        self.starved_seconds = 0.0
+        # Time spent waiting on a full output queue: downstream is applying backpressure
+        self.blocked_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items_in=0, items_out=0, busy=0.0, starved=0.0, blocked=0.0):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += busy
+            self.starved_seconds += starved
+            self.blocked_seconds += blocked
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "starved_seconds": round(self.starved_seconds, 4),
+            "blocked_seconds": round(self.blocked_seconds, 4),
+        }
+
+class Stage:
+    """
+    One step of a RefreshPipeline
+    :param name: Name used in the stats report
+    :param handler: Called as handler(item, emit); emit(value) passes value to the next stage.
+                    The first stage is called once as handler(None, emit) and acts as the source.
+    :param workers: Number of threads consuming this stage's input queue
+    :param batch_size: When set, handler receives lists of up to batch_size items instead of single items
+    """
+    def __init__(self, name, handler, workers=1, batch_size=None):
+        # With no workers a stage never consumes its queue and the pipeline hangs,
+        # and a falsy batch_size would silently hand a batch handler single items
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least 1 worker, got {workers}")
+        if batch_size is not None and batch_size < 1:
+            raise ValueError(f"Stage '{name}' batch_size must be at least 1, got {batch_size}")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+
+class RefreshPipeline:
+    """Run stages concurrently, connected by bounded queues, and collect per-stage stats"""
+    def __init__(self, stages, queue_size=256, poll_interval=0.1):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.stats = [StageStats(stage.name, stage.workers) for stage in stages]
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+        self._abort = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+        self._remaining_workers = [stage.workers for stage in stages]
+        self._remaining_lock = threading.Lock()
+
+    def _put(self, output_queue, item):
+        while not self._abort.is_set():
+            try:
+                output_queue.put(item, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                continue
+        raise _Aborted()
+
+    def _get(self, input_queue):
+        while not self._abort.is_set():
+            try:
+                return input_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+        raise _Aborted()
+
+    def _make_emit(self, index, stats, blocked):
+        if index + 1 >= len(self.stages):
+            def emit(value):
+                stats.add(items_out=1)
+            return emit
+
+        output_queue = self._queues[index]
+
+        def emit(value):
+            started = time.perf_counter()
+            self._put(output_queue, value)
+            waited = time.perf_counter() - started
+            blocked[0] += waited
+            stats.add(items_out=1, blocked=waited)
+        return emit
+
+    def _finish_worker(self, index):
+        with self._remaining_lock:
+            self._remaining_workers[index] -= 1
+            last_worker = self._remaining_workers[index] == 0
+
+        if last_worker and index + 1 < len(self.stages):
+            # Wake every worker of the next stage
+            for _ in range(self.stages[index + 1].workers):
+                self._put(self._queues[index], _DONE)
+
+    def _call(self, stage, stats, item, emit, blocked):
+        started = time.perf_counter()
+        blocked_before = blocked[0]
+        stage.handler(item, emit)
+        # Time spent blocked inside emit is already reported as backpressure
+        stats.add(busy=time.perf_counter() - started - (blocked[0] - blocked_before))
+
+    def _run_worker(self, index):
+        stage = self.stages[index]
+        stats = self.stats[index]
+        # This worker's time blocked on the output queue, kept apart from the other workers
+        blocked = [0.0]
+        emit = self._make_emit(index, stats, blocked)
+
+        try:
+            if index == 0:
+                self._call(stage, stats, None, emit, blocked)
+            else:
+                input_queue = self._queues[index - 1]
+                batch = []
+                while True:
+                    started = time.perf_counter()
+                    item = self._get(input_queue)
+                    stats.add(starved=time.perf_counter() - started)
+                    if item is _DONE:
+                        break
+
+                    stats.add(items_in=1)
+                    if stage.batch_size:
+                        batch.append(item)
+                        if len(batch) >= stage.batch_size:
+                            self._call(stage, stats, batch, emit, blocked)
+                            batch = []
+                    else:
+                        self._call(stage, stats, item, emit, blocked)
+
+                if batch:
+                    self._call(stage, stats, batch, emit, blocked)
+
+            self._finish_worker(index)
+
+        except _Aborted:
+            pass
+
+        except Exception as e:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = e
+            self._abort.set()
+
+    def run(self):
+        """
+        Run the pipeline to completion
+        :return: List of per-stage stats dicts
+        :raises: The first exception raised by any stage
+        """
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                # Workers run in a copy of the caller's context, so context variables such as
+                # the query profiler's current request follow the work onto the worker threads
+                thread = threading.Thread(
+                    target=contextvars.copy_context().run,
+                    args=(self._run_worker, index),
+                    name=f"refresh-{stage.name}-{worker}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        return [stats.as_dict() for stats in self.stats]
+
+class _Aborted(Exception):
+    """Unwinds a worker after another stage has failed"""
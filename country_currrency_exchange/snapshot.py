@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+class ReadSnapshot:
+    """
+    In-memory copy of the countries table, already serialized for the API.
+    Written to disk after each refresh so new workers can serve reads without a DB scan.
+    """
+    def __init__(self, countries, last_refreshed_at=None, mtime=None):
+        self.countries = countries
+        self.last_refreshed_at = last_refreshed_at
+        # Modification time of the file this snapshot was loaded from or saved to
+        self.mtime = mtime
+
+    @classmethod
+    def from_countries(cls, countries):
+        """
+        Build a snapshot from Country objects
+        :param countries: List of Country objects
+        :return: ReadSnapshot
+        """
+        rows = [
+            {
+                "id": country.id,
+                "name": country.name,
+                "capital": country.capital,
+                "region": country.region,
+                "population": country.population,
+                "currency_code": country.currency_code,
+                "exchange_rate": country.exchange_rate,
+                "estimated_gdp": country.estimated_gdp,
+                "flag_url": country.flag_url,
+                "last_refreshed_at": country.last_refreshed_at.isoformat() if country.last_refreshed_at else None
+            }
+            for country in countries
+        ]
+        timestamps = [country.last_refreshed_at for country in countries if country.last_refreshed_at]
+        last_refreshed_at = max(timestamps).isoformat() if timestamps else None
+        return cls(rows, last_refreshed_at)
+
+    @classmethod
+    def load(cls, path):
+        """Read a snapshot written by save, or return None when there is no usable file"""
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'r', encoding='utf-8') as snapshot_file:
+                data = json.load(snapshot_file)
+            return cls(data['countries'], data.get('last_refreshed_at'), mtime)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if os.path.exists(path):
+                print(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as snapshot_file:
+            json.dump({"countries": self.countries, "last_refreshed_at": self.last_refreshed_at}, snapshot_file)
+        # Replace atomically so other workers never load a half written snapshot
+        os.replace(temp_path, path)
+        self.mtime = os.path.getmtime(path)
+
+    def without(self, name):
+        """Copy of this snapshot with the named country removed"""
+        countries = [country for country in self.countries if country['name'] != name]
+        timestamps = [country['last_refreshed_at'] for country in countries if country['last_refreshed_at']]
+        return ReadSnapshot(countries, max(timestamps) if timestamps else None)
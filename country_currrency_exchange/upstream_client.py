@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed, wait
+
+class UpstreamError(Exception):
+    """Raised when an upstream source could not be fetched after retries"""
+    def __init__(self, message, url=None):
+        super().__init__(message)
+        self.url = url
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling upstream while a source's circuit breaker is open"""
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let a single trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+class UpstreamClient:
+    """
+    HTTP JSON client with bounded retries, jittered exponential backoff,
+    one circuit breaker per source and optional hedged requests.
+    Each get_json call, retries and backoff included, gives up after deadline seconds.
+    """
+    def __init__(self, timeout=10, max_retries=2, backoff_base=0.5, backoff_max=5,
+                 failure_threshold=3, reset_timeout=60, deadline=15):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def breaker(self, source):
+        with self._breakers_lock:
+            if source not in self._breakers:
+                self._breakers[source] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[source]
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting upstream in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _get(self, url, timeout):
+        # requests is imported on first use so app startup does not pay for it
+        import requests
+
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @property
+    def executor(self):
+        # Hedging threads are only started once a hedged request is made
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upstream')
+            return self._executor
+
+    def _hedged_get(self, url, hedge_after, deadline_at):
+        timeout = min(self.timeout, deadline_at - time.monotonic())
+        futures = [self.executor.submit(self._get, url, timeout)]
+        done, _ = wait(futures, timeout=hedge_after)
+        remaining = deadline_at - time.monotonic()
+        if not done and remaining > 0:
+            # The first request is slow, race a second one against it
+            futures.append(self.executor.submit(self._get, url, min(self.timeout, remaining)))
+
+        error = None
+        # Stop waiting at the deadline even if a request is still trickling in
+        for future in as_completed(futures, timeout=max(0, deadline_at - time.monotonic())):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    def _is_retryable(self, error):
+        import requests
+
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return status >= 500 or status == 429
+        return True
+
+    def get_json(self, source, url, hedge_after=None):
+        """
+        Fetch and decode a JSON payload
+        :param source: Name of the upstream, each name gets its own circuit breaker
+        :param url: URL to fetch
+        :param hedge_after: Seconds to wait before firing a duplicate request, None to disable
+        :return: Decoded JSON payload
+        """
+        import requests
+
+        breaker = self.breaker(source)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit breaker for {source} is open", url=url)
+
+        deadline_at = time.monotonic() + self.deadline
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                last_error = last_error or TimeoutError(f"no response within the {self.deadline}s deadline")
+                break
+
+            try:
+                if hedge_after:
+                    payload = self._hedged_get(url, hedge_after, deadline_at)
+                else:
+                    payload = self._get(url, min(self.timeout, remaining))
+            except (requests.RequestException, ValueError, FutureTimeoutError) as e:
+                if isinstance(e, FutureTimeoutError):
+                    e = TimeoutError(f"no response within the {self.deadline}s deadline")
+                last_error = e
+                if not self._is_retryable(e):
+                    break
+                if attempt < self.max_retries:
+                    backoff = self._backoff(attempt)
+                    if time.monotonic() + backoff >= deadline_at:
+                        # No time left for another attempt after backing off
+                        break
+                    time.sleep(backoff)
+                continue
+
+            breaker.record_success()
+            return payload
+
+        # The breaker counts failed calls, not attempts, so one blip with retries cannot trip it
+        breaker.record_failure()
+        raise UpstreamError(f"Could not fetch {source} from {url}: {last_error}", url=url) from last_error
@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 
 from flask import Flask, jsonify, request, send_file
-import requests
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend
-import matplotlib.pyplot as plt
 import io
 from datetime import datetime
+import os
 from fetch_data import FetchData
+from rate_limit import RateLimiter, rate_limited
+from single_flight import SingleFlight
 
 app = Flask(__name__)
 
+# Per-client token bucket limits for the expensive endpoints: requests per minute and burst size (0 per minute disables)
+rate_limits = {
+    'refresh': (int(os.getenv('REFRESH_RATE_PER_MINUTE', 2)), int(os.getenv('REFRESH_RATE_BURST', 2))),
+    'list': (int(os.getenv('LIST_RATE_PER_MINUTE', 120)), int(os.getenv('LIST_RATE_BURST', 30))),
+    'image': (int(os.getenv('IMAGE_RATE_PER_MINUTE', 30)), int(os.getenv('IMAGE_RATE_BURST', 10))),
+}
+app.extensions['rate_limiters'] = {
+    name: RateLimiter(per_minute, burst)
+    for name, (per_minute, burst) in rate_limits.items()
+    if per_minute > 0
+}
+
+# Concurrent identical requests share one computation
+coalesce = SingleFlight()
+
 # Initialize fetcher
 try:
     fetcher = FetchData()
@@ -43,10 +57,11 @@ def check_db_connection():
         return jsonify({"error": "Database not connected"}), 500
 
 @app.route('/countries/refresh', methods=['POST'], strict_slashes=False)
+@rate_limited('refresh')
 def fetch_and_cache_countries():
     """Fetch all countries and exchange rates, then cache them in the database"""
     try:
-        result = fetcher.fetch_and_store_countries()
+        result = coalesce.do('refresh', fetcher.fetch_and_store_countries)
         return jsonify({
             "message": "Countries data fetched and stored successfully.",
             "countries_added": result
@@ -55,16 +70,17 @@ def fetch_and_cache_countries():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/countries', methods=['GET'], strict_slashes=False)
+@rate_limited('list')
 def get_countries():
     """Get all countries from the DB (support filters and sorting)"""
     region = request.args.get('region')
     currency = request.args.get('currency')
     sort = request.args.get('sort')
     
-    try:
+    def list_countries():
         countries = fetcher.get_all_countries()
         if not countries:
-            return jsonify([]), 200
+            return []
             
         countries_list = [
             {
@@ -97,6 +113,10 @@ def get_countries():
         elif sort == 'population_asc':
             countries_list = sorted(countries_list, key=lambda x: x['population'] or 0, reverse=False)
 
+        return countries_list
+
+    try:
+        countries_list = coalesce.do(('countries', region, currency, sort), list_countries)
         return jsonify(countries_list), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -158,54 +178,67 @@ def total_countries_and_last_refreshed():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def render_summary_png(countries):
+    """Render the countries summary chart as PNG bytes"""
+    # matplotlib is slow to import, only load it once an image is requested
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-GUI backend
+    import matplotlib.pyplot as plt
+
+    # Create a summary image
+    plt.figure(figsize=(12, 8))
+    
+    # Prepare data for visualization
+    regions = {}
+    for country in countries:
+        region = country.region or 'Unknown'
+        regions[region] = regions.get(region, 0) + 1
+    
+    # Create visualization
+    if len(regions) > 1:
+        # Create a pie chart of countries by region
+        plt.subplot(1, 2, 1)
+        plt.pie(regions.values(), labels=regions.keys(), autopct='%1.1f%%')
+        plt.title('Countries by Region')
+        
+        # Create a bar chart of top 10 countries by population
+        plt.subplot(1, 2, 2)
+        sorted_countries = sorted(countries, key=lambda x: x.population or 0, reverse=True)[:10]
+        country_names = [country.name[:15] + '...' if len(country.name) > 15 else country.name for country in sorted_countries]
+        populations = [country.population or 0 for country in sorted_countries]
+        plt.barh(country_names, populations)
+        plt.title('Top 10 Countries by Population')
+        plt.xlabel('Population')
+    else:
+        # If we don't have enough regions, just show one chart
+        plt.barh(list(regions.keys()), list(regions.values()))
+        plt.title('Countries by Region')
+        plt.xlabel('Number of Countries')
+    
+    plt.tight_layout()
+    
+    # Save the plot to a bytes buffer
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+    plt.close()
+    return buf.getvalue()
+
 @app.route('/countries/image', methods=['GET'], strict_slashes=False)
+@rate_limited('image')
 def get_country_flags():
     """Serve summary image of country flags"""
-    try:
+    def render():
         countries = fetcher.get_all_countries()
+        return render_summary_png(countries) if countries else None
+
+    try:
+        # Concurrent requests share one render; each gets its own buffer over the shared bytes
+        image_data = coalesce.do('image', render)
         
-        if not countries:
+        if image_data is None:
             return jsonify({"message": "No countries found"}), 404
-        
-        # Create a summary image
-        plt.figure(figsize=(12, 8))
-        
-        # Prepare data for visualization
-        regions = {}
-        for country in countries:
-            region = country.region or 'Unknown'
-            regions[region] = regions.get(region, 0) + 1
-        
-        # Create visualization
-        if len(regions) > 1:
-            # Create a pie chart of countries by region
-            plt.subplot(1, 2, 1)
-            plt.pie(regions.values(), labels=regions.keys(), autopct='%1.1f%%')
-            plt.title('Countries by Region')
-            
-            # Create a bar chart of top 10 countries by population
-            plt.subplot(1, 2, 2)
-            sorted_countries = sorted(countries, key=lambda x: x.population or 0, reverse=True)[:10]
-            country_names = [country.name[:15] + '...' if len(country.name) > 15 else country.name for country in sorted_countries]
-            populations = [country.population or 0 for country in sorted_countries]
-            plt.barh(country_names, populations)
-            plt.title('Top 10 Countries by Population')
-            plt.xlabel('Population')
-        else:
-            # If we don't have enough regions, just show one chart
-            plt.barh(list(regions.keys()), list(regions.values()))
-            plt.title('Countries by Region')
-            plt.xlabel('Number of Countries')
-        
-        plt.tight_layout()
-        
-        # Save the plot to a bytes buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
-        
-        return send_file(buf, mimetype='image/png', as_attachment=False, download_name='countries_summary.png')
+
+        return send_file(io.BytesIO(image_data), mimetype='image/png', as_attachment=False, download_name='countries_summary.png')
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
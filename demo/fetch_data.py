@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import requests
 import random
 from db import DB
 from country import Country
@@ -12,6 +11,9 @@ class FetchData:
 
     def fetch_and_store_countries(self):
         """Fetch countries from REST Countries API and store in database"""
+        # requests is imported on first use so app startup does not pay for it
+        import requests
+
         country_api_url = "https://restcountries.com/v3.1/all?fields=name,capital,region,population,flags,currencies"
         exchange_rate_api_url = "https://open.er-api.com/v6/latest/USD"
 
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        :param rate: Tokens added per second
+        :param capacity: Maximum tokens, i.e. the allowed burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self):
+        """
+        Take one token if available
+        :return: Tuple of (allowed, remaining tokens, seconds until the next token)
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, int(self.tokens), 0
+        return False, 0, (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Token bucket per client, keeping at most max_clients buckets"""
+    def __init__(self, per_minute, burst, max_clients=10000):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, client):
+        with self._lock:
+            bucket = self._buckets.pop(client, None)
+            if bucket is None:
+                bucket = TokenBucket(self.per_minute / 60.0, self.burst)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                # Forget the least recently seen client
+                self._buckets.popitem(last=False)
+            return bucket.consume()
+
+def rate_limited(name):
+    """
+    Limit a view with the RateLimiter registered as app.extensions['rate_limiters'][name].
+    Views without a registered limiter are not limited.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiters', {}).get(name)
+            if limiter is None:
+                return view(*args, **kwargs)
+
+            allowed, remaining, retry_after = limiter.hit(request.remote_addr)
+            if allowed:
+                response = make_response(view(*args, **kwargs))
+            else:
+                response = make_response(jsonify({"error": "Too many requests"}), 429)
+                response.headers['Retry-After'] = str(math.ceil(retry_after))
+
+            response.headers['X-RateLimit-Limit'] = str(limiter.per_minute)
+            response.headers['X-RateLimit-Burst'] = str(limiter.burst)
+            response.headers['X-RateLimit-Remaining'] = str(remaining)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import threading
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution whose result they all share"""
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn, or wait for the in-flight run with the same key
+        :param key: Hashable identifying the computation
+        :param fn: Callable taking no arguments
+        :return: fn's result, shared with every caller that joined the same run
+        :raises: fn's exception, in every caller that joined the same run
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Later callers start a fresh run instead of reusing this result
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result